@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+# Compare peak memory of converted objects in a simulated getyaml run, where
+# each vsys holds several object types until they are written (as
+# get_modules_from_firewall() does): one dict per object vs. compact records
+# from modules/records.py, written to yaml directly. Both forms intern
+# values, and both are written and released per vsys, so only the object
+# representation differs. Synthetic objects are generated from the params
+# lists in panos-api-parameters.yml, so no device or pan-os-python install
+# is needed. The yaml output goes to os.devnull.
+#
+# Usage:
+#   python benchmarks/memory.py
+#   python benchmarks/memory.py --hosts 4 --objects 5000 \
+#     --object-type policies_security_rule --object-type objects_address_object
+
+import argparse
+import gc
+import os
+import random
+import sys
+import tracemalloc
+import yaml
+
+work_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, work_dir)
+
+from modules import records
+from modules.utilities import Utilities
+
+api_params_files = [
+  work_dir + '/configs/panos-api-parameters.yml',
+  work_dir + '/configs/panos-api-parameters.yml.dist'
+]
+
+default_object_types = [
+  'policies_security_rule',
+  'policies_nat_rule',
+  'objects_address_object',
+  'objects_address_group',
+  'objects_service_object'
+]
+
+class FakeObject:
+  # stands in for a pan-os-python object returned by refreshall()
+  pass
+
+def parse_arguments():
+  parser = argparse.ArgumentParser(
+      description='panos-conf converted-object memory benchmark')
+  parser.add_argument('--hosts', type=int, default=2,
+      help="number of simulated hosts (default: 2)")
+  parser.add_argument('--objects', type=int, default=2000,
+      help="number of objects per object type and host (default: 2000)")
+  parser.add_argument('--object-type', action='append',
+      help="<module>_<object type> in panos-api-parameters.yml, repeatable "
+           f"(default: { ', '.join(default_object_types) })")
+  return parser.parse_args()
+
+def load_params(object_types):
+  for file in api_params_files:
+    if os.path.exists(file):
+      with open(file, 'r') as f:
+        api_params = yaml.safe_load(f)
+      break
+
+  params = {}
+  for module in api_params['modules']:
+    for object_type in api_params['modules'][module]:
+      name = f"{ module }_{ object_type }"
+      if name in object_types:
+        params[name] = api_params['modules'][module][object_type]['params']
+  return params
+
+def fresh(value):
+  # parsed xml gives every object its own string instances
+  return ''.join(list(value))
+
+def create_objects(params, count):
+  rng = random.Random(0)
+  objects = []
+  for i in range(count):
+    obj = FakeObject()
+    for n, param in enumerate(params):
+      if param == 'name':
+        setattr(obj, param, f"rule-{ i }")
+      elif n % 3 == 0:
+        # sparse params, left unset like most optional attributes
+        continue
+      elif n % 3 == 1:
+        setattr(obj, param, [ fresh(f"value-{ rng.randrange(20) }")
+                              for j in range(rng.randrange(1, 4)) ])
+      else:
+        setattr(obj, param, fresh(f"value-{ rng.randrange(50) }"))
+    objects.append(obj)
+  return objects
+
+def convert_dicts(objects, params):
+  object_list = []
+  for obj in objects:
+    obj_info = {}
+    for param in params:
+      param_value = getattr(obj, param, None)
+      if param_value is not None:
+        obj_info[param] = records.intern_value(param_value)
+    object_list.append(obj_info)
+  return object_list
+
+def convert_records(objects, params):
+  schema = records.get_schema(params)
+  return [ schema.new_record([ getattr(obj, p, None) for p in params ])
+           for obj in objects ]
+
+def run(convert, params, hosts, count):
+  utils = Utilities()
+  for host in range(hosts):
+    # one vsys: every object type is fetched and converted, then written
+    modules = {}
+    for object_type in params:
+      objects = create_objects(params[object_type], count)
+      modules[object_type] = convert(objects, params[object_type])
+      del objects
+    for object_type in modules:
+      utils.yaml_to_file(os.devnull, modules[object_type], True)
+      modules[object_type] = None
+    del modules
+
+def measure(convert, params, hosts, count):
+  gc.collect()
+  tracemalloc.start()
+  run(convert, params, hosts, count)
+  gc.collect()
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  return peak
+
+def main():
+  args = parse_arguments()
+  params = load_params(args.object_type or default_object_types)
+
+  print(f"{ args.hosts } host(s) x { args.objects } objects of "
+        f"{ len(params) } object type(s): { ', '.join(params) }")
+  results = {}
+  for name, convert in (('dicts', convert_dicts), ('records', convert_records)):
+    results[name] = measure(convert, params, args.hosts, args.objects)
+    print(f"{ name:8s} peak: { results[name] / 2**20:8.1f} MiB")
+
+  if results['records'] < results['dicts']:
+    print(f"records peak is { results['records'] / results['dicts']:.0%} "
+          f"of the dicts peak")
+
+if __name__ == '__main__':
+  main()
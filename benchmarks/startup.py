@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+# Measure panos-conf.py startup cost with `python -X importtime`, and fail if
+# it exceeds a budget, or if heavy modules are imported where they shouldn't.
+#
+# Usage:
+#   python benchmarks/startup.py
+#   python benchmarks/startup.py --budget-ms 150 -- getyaml --help
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+work_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+script = work_dir + '/panos-conf.py'
+
+# modules only subcommands that need them should import
+heavy_modules = [ 'panos', 'cryptography', 'keyring', 'requests' ]
+
+importtime_regex = re.compile(
+    r'^import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)$')
+
+def parse_arguments():
+  parser = argparse.ArgumentParser(
+      description='panos-conf startup-time benchmark')
+  parser.add_argument('--budget-ms', type=float, default=100.0,
+      help="max cumulative import time in milliseconds (default: 100)")
+  parser.add_argument('--runs', type=int, default=5,
+      help="number of runs, the best one is reported (default: 5)")
+  parser.add_argument('cli_args', nargs='*', default=['--help'],
+      help="arguments passed to panos-conf.py (default: --help)")
+  return parser.parse_args()
+
+def run_importtime(cli_args):
+  cmd = [ sys.executable, '-X', 'importtime', script ] + cli_args
+  start = time.perf_counter()
+  result = subprocess.run(cmd, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, text=True,
+                          stdin=subprocess.DEVNULL)
+  wall_ms = (time.perf_counter() - start) * 1000
+
+  import_us = 0
+  modules = []
+  stderr = []
+  for line in result.stderr.splitlines():
+    m = importtime_regex.match(line)
+    if m is None:
+      if not line.startswith('import time:'):
+        stderr.append(line)
+      continue
+    modules.append(m.group(4))
+    if len(m.group(3)) == 1:
+      # top-level import; cumulative time includes its children
+      import_us += int(m.group(2))
+
+  return {
+    "returncode": result.returncode,
+    "stderr": stderr,
+    "wall_ms": wall_ms,
+    "import_ms": import_us / 1000,
+    "modules": modules
+  }
+
+def main():
+  args = parse_arguments()
+  runs = [ run_importtime(args.cli_args) for i in range(args.runs) ]
+  best = min(runs, key=lambda k: k['import_ms'])
+
+  print(f"args:        { ' '.join(args.cli_args) }")
+
+  # a crashing run dies early, so its import time would look good
+  crashed = [ r for r in runs if r['returncode'] != 0 ]
+  if len(crashed) > 0:
+    print('\n'.join(crashed[0]['stderr']))
+    print(f"FAIL: panos-conf.py exited with { crashed[0]['returncode'] }")
+    sys.exit(1)
+
+  print(f"wall time:   { min(r['wall_ms'] for r in runs):.1f} ms")
+  print(f"import time: { best['import_ms']:.1f} ms "
+        f"(budget { args.budget_ms:.1f} ms)")
+
+  failed = False
+  loaded = [ m for m in best['modules'] if m.split('.')[0] in heavy_modules ]
+  help_only = '--help' in args.cli_args or '-h' in args.cli_args
+  if len(loaded) > 0 and help_only:
+    print(f"FAIL: heavy modules imported: { ', '.join(sorted(set(loaded))) }")
+    failed = True
+
+  if best['import_ms'] > args.budget_ms:
+    print("FAIL: import time over budget")
+    failed = True
+
+  sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+  main()
@@ -1,11 +1,16 @@
 #!/usr/bin/env python3
 
+import concurrent.futures
+import fnmatch
+import multiprocessing
 import panos
 import panos.device
 import panos.firewall
 import panos.objects
 import panos.policies
+import re
 import xml.etree.ElementTree as etree
+from modules import records
 
 class PanosUtils:
   def __init__(self, **kwargs):
@@ -27,12 +32,26 @@ class PanosUtils:
     else:
       return fw
 
-  def get_yaml_conf(self, force_overwrite):
-    fw_configs = self.get_configs_from_all_firewalls()
+  def get_yaml_conf(self, force_overwrite, workers=0, pool_threshold=1000,
+                    selectors=None):
+    plan = self.get_fetch_plan(selectors)
+    if len(plan) == 0:
+      return False
 
-    for hostname in fw_configs:
-      for vsys in fw_configs[hostname]:
-        modules = fw_configs[hostname][vsys]['config_modules']
+    skip_null = self.utils.config['settings']['skip_null_param']
+    pool = None
+    futures = {}
+    write_ok = True
+    if workers > 0:
+      # large object types are written as yaml in worker processes,
+      # while fetching continues here
+      # spawn, so workers don't inherit the log listener thread/locks
+      pool = concurrent.futures.ProcessPoolExecutor(
+          max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+    try:
+      for hostname, vsys, conn, modules in self.iter_configs_from_all_firewalls(
+          plan=plan):
         for module in modules:
           for object_type in modules[module]:
             file_params = {
@@ -41,25 +60,185 @@ class PanosUtils:
               "force_overwrite": force_overwrite
             }
             data = modules[module][object_type]
-            if len(data) > 0:
+            if len(data) == 0:
               # don't write blank configs
-              self.utils.write_host_config_file(data, file_params)
+              continue
+
+            if pool is not None and len(data) >= pool_threshold:
+              # hand over compact records, never pan-os-python objects
+              conf_file = self.utils.get_host_config_filepath(file_params)
+              future = pool.submit(records.records_to_file, conf_file, data,
+                                   skip_null, force_overwrite)
+              futures[future] = conf_file
+              # the pool holds submitted records until their worker is done,
+              # so cap in-flight work instead of queueing a whole fleet
+              if not self.wait_for_futures(futures, 2 * workers):
+                write_ok = False
+            else:
+              self.utils.write_host_config_file(data, file_params,
+                                                skip_null=skip_null)
+            modules[module][object_type] = None
+    finally:
+      if pool is not None:
+        if not self.wait_for_futures(futures):
+          write_ok = False
+        pool.shutdown()
+    return write_ok
+
+  def wait_for_futures(self, futures, max_pending=0):
+    # wait until at most max_pending futures ({ future: conf_file }) are
+    # left; returns False if any of the finished ones failed
+    write_ok = True
+    while len(futures) > max_pending:
+      done, pending = concurrent.futures.wait(
+          futures, return_when=concurrent.futures.FIRST_COMPLETED)
+      for future in done:
+        conf_file = futures.pop(future)
+        try:
+          future.result()
+        except Exception as e:
+          self.utils.log.error(f"Could not write config file { conf_file }: "
+                               f"{ e }")
+          write_ok = False
+    return write_ok
 
-  def get_configs_from_all_firewalls(self, return_object=False):
+  def get_configs_from_all_firewalls(self, return_object=False, plan=None):
     fw_configs = {}
+    for hostname, vsys, conn, fw_config in self.iter_configs_from_all_firewalls(
+        return_object, plan):
+      fw_configs.setdefault(hostname, {})
+      fw_configs[hostname][vsys] = {}
+      fw_configs[hostname][vsys]['config_modules'] = fw_config
+      if return_object:
+        fw_configs[hostname][vsys]['conn'] = conn
+    return fw_configs
+
+  def get_fetch_plan(self, selectors=None):
+    # resolve selectors up front, so only selected refreshall calls are made
+    # selectors = {
+    #   "hosts": [ 'fw-osl-*' ],            # hostname globs
+    #   "host_regex": [ '^fw-(osl|ber)' ],  # hostname regexes
+    #   "groups": [ 'oslo' ],               # 'groups' of hosts in config
+    #   "vsys": [ 'vsys1' ],                # vsys globs
+    #   "modules": [ 'policies' ],          # module globs
+    #   "object_types": [ 'security_rule' ] # object type globs, with or
+    # }                                     # without module prefix
+    # missing/empty selectors match everything
+    if selectors is None:
+      selectors = {}
+
+    for regex in selectors.get('host_regex') or []:
+      try:
+        re.compile(regex, re.IGNORECASE)
+      except re.error as e:
+        self.utils.log.error(f"Invalid host regex '{ regex }': { e }")
+        return []
+
+    modules = {}
+    api_modules = self.utils.api_params['modules']
+    for module in api_modules:
+      if not self.plan_match(module, selectors.get('modules')):
+        continue
+      for object_type in api_modules[module]:
+        if api_modules[module][object_type]['skip']:
+          continue
+        if not (self.plan_match(object_type, selectors.get('object_types')) or
+                self.plan_match(f"{ module }_{ object_type }",
+                                selectors.get('object_types'))):
+          continue
+        modules.setdefault(module, {})
+        modules[module][object_type] = api_modules[module][object_type]
+
+    if len(modules) == 0:
+      # don't connect to any device when nothing would be fetched
+      self.utils.log.error("No object types match the given module/object "
+                           "type selectors")
+      return []
+
+    plan = []
+    hosts_without_api_key = 0
     for host in self.utils.config['hosts']:
-      self.utils.log.info(f"Getting config for host: { host['hostname'] }")
+      if not self.plan_host_match(host, selectors):
+        continue
       if host.get('api_key', None) is None:
+        hosts_without_api_key += 1
+        self.utils.log.info(f"No API key for host: { host['hostname'] }",
+                            extra={ "host": host['hostname'] })
         continue
 
       vsys_list = self.utils.get_hostname_vsys(host['hostname'])
-      for vsys in vsys_list:
-        self.utils.log.info(f"Getting config for vsys: { vsys }")
+      vsys_selected = [ vsys for vsys in vsys_list
+                        if self.plan_match(vsys, selectors.get('vsys')) ]
+      if len(vsys_selected) == 0:
+        continue
+
+      plan.append({
+        "host": host,
+        "vsys_list": vsys_list,
+        "vsys": vsys_selected,
+        "modules": modules
+      })
+
+    if len(plan) == 0:
+      if hosts_without_api_key > 0 and not selectors.get('vsys'):
+        self.utils.log.error("No selected hosts with an API key "
+                             "(see apikey --set)")
+      else:
+        self.utils.log.error("No hosts/vsys match the given selectors")
+      return plan
+
+    object_types = sum(len(modules[module]) for module in modules)
+    self.utils.log.info(f"Fetch plan: { len(plan) } host(s), "
+                        f"{ object_types } object type(s)")
+    return plan
+
+  def plan_match(self, name, patterns, ignore_case=False):
+    if not patterns:
+      return True
+    if ignore_case:
+      name = name.lower()
+    for pattern in patterns:
+      if fnmatch.fnmatchcase(name, pattern.lower() if ignore_case else pattern):
+        return True
+    return False
+
+  def plan_host_match(self, host, selectors):
+    hosts = selectors.get('hosts')
+    host_regex = selectors.get('host_regex')
+    groups = selectors.get('groups')
+
+    # hostnames are case-insensitive, like the --host-regex matching
+    if hosts and not self.plan_match(host['hostname'], hosts,
+                                     ignore_case=True):
+      return False
+    if host_regex and not any(
+        self.utils.check_regex_match(regex, host['hostname'])
+        for regex in host_regex):
+      return False
+    if groups and not set(groups) & set(host.get('groups', [])):
+      return False
+    return True
+
+  def iter_configs_from_all_firewalls(self, return_object=False, plan=None):
+    # yields (hostname, vsys, conn, config_modules) as each vsys is fetched
+    if plan is None:
+      plan = self.get_fetch_plan()
+
+    for host_plan in plan:
+      host = host_plan['host']
+      self.utils.log.info(f"Getting config for host: { host['hostname'] }",
+                          extra={ "host": host['hostname'] })
+
+      vsys_list = host_plan['vsys_list']
+      for vsys in host_plan['vsys']:
+        self.utils.log.info(f"Getting config for vsys: { vsys }",
+                            extra={ "host": host['hostname'], "vsys": vsys })
         conn = {
           "hostname": host['hostname'],
           "host_args": host,
           "add": False,
-          "return_object": return_object
+          "return_object": return_object,
+          "log_extra": { "host": host['hostname'], "vsys": vsys }
         }
         if (len(vsys_list) < 2) and (vsys == 'vsys1'):
           # on device that only has one vsys
@@ -78,28 +257,38 @@ class PanosUtils:
         conn['rulebase'] = panos.policies.Rulebase()
         conn['vsys'].add(conn['rulebase'])
 
-        fw_config = self.get_modules_from_firewall(conn)
-        fw_configs[host['hostname']] = {}
-        fw_configs[host['hostname']][vsys] = {}
-        fw_configs[host['hostname']][vsys]['conn'] = conn
-        fw_configs[host['hostname']][vsys]['config_modules'] = fw_config
-    return fw_configs
+        fw_config = self.get_modules_from_firewall(conn,
+                                                   host_plan['modules'])
+        if not return_object:
+          # objects are converted; drop the pan-os-python tree right away
+          conn.clear()
+          conn = None
+        yield host['hostname'], vsys, conn, fw_config
 
-  def get_modules_from_firewall(self, conn):
-    modules = self.utils.api_params['modules']
+  def get_modules_from_firewall(self, conn, modules=None):
+    if modules is None:
+      modules = self.utils.api_params['modules']
     modules_config = {}
     for module in modules:
-      self.utils.log.debug(f"Getting module config for: { module }")
+      self.utils.log.debug(f"Getting module config for: { module }",
+                           extra={ **conn['log_extra'],
+                                   "config_module": module })
       modules_config[module] = self.get_objects_from_firewall(conn, 
-                                                              modules[module])
+                                                              modules[module],
+                                                              module)
     return modules_config
   
-  def get_objects_from_firewall(self, conn, module):
+  def get_objects_from_firewall(self, conn, module, module_name=None):
     objects_config = {}
     for object_type in module:
       if module[object_type]['skip']:
         continue
 
+      self.utils.log.debug(f"Getting object config for: { object_type }",
+                           extra={ **conn['log_extra'],
+                                   "config_module": module_name,
+                                   "object_type": object_type })
+
       object_info = module[object_type]
       object_class = self.utils.class_for_name(object_info['module'],
                                                object_info['class'])
@@ -115,28 +304,24 @@ class PanosUtils:
     if conn['return_object']:
       return object_data
     else:
-      # we convert to dictionary
+      # we convert to compact records, see modules/records.py
       return self.parse_object_from_firewall(object_data, object_info)
       
   def parse_object_from_firewall(self, object_data, object_info):
     object_list = []
+    schema = records.get_schema(object_info['params'])
     for obj in object_data:
-      obj_info = self.get_object_attributes(obj, object_info['params'])
+      children = None
       if self.object_has_children(obj, object_info):
-        obj_info['children'] = self.get_object_children(obj, object_info)
-      object_list.append(dict(obj_info))
+        children = self.get_object_children(obj, object_info)
+      object_list.append(self.get_object_record(obj, schema, children))
 
     return self.utils.return_sorted_list(object_list, 
                                          object_info['sort_param'])
 
-  def get_object_attributes(self, obj, params):
-    obj_info = {}
-    for param in params:
-      param_value = getattr(obj, param, None)
-      if (param_value is not None or
-          not self.utils.config['settings']['skip_null_param']):
-        obj_info[param] = param_value
-    return obj_info
+  def get_object_record(self, obj, schema, children=None):
+    values = [ getattr(obj, param, None) for param in schema.keys ]
+    return schema.new_record(values, children)
 
   def object_has_children(self, obj, object_info):
     children = getattr(obj, 'children', False)
@@ -158,18 +343,22 @@ class PanosUtils:
         )
 
         if isinstance(child_obj, child_conf_class):
-          child_dict = self.get_object_attributes(
-              child_obj, child_conf_info['params'])
-
+          grandchildren = None
           if self.object_has_children(child_obj, child_conf):
-            child_dict['children'] = self.get_object_children(child_obj,
-                                                              child_conf)
-          
+            grandchildren = self.get_object_children(child_obj, child_conf)
+
+          child_record = self.get_object_record(
+              child_obj, records.get_schema(child_conf_info['params']),
+              grandchildren)
+
           if child_conf['name'] not in children_dict:
             children_dict[child_conf['name']] = []
-          children_dict[child_conf['name']].append(child_dict)
-          children_dict[child_conf['name']] = self.utils.return_sorted_list(
-              children_dict[child_conf['name']], child_conf_info['sort_param'])
+          children_dict[child_conf['name']].append(child_record)
+
+    for child_name in children_dict:
+      child_conf_info = self.utils.api_params['children'][child_name]
+      children_dict[child_name] = self.utils.return_sorted_list(
+          children_dict[child_name], child_conf_info['sort_param'])
 
     return children_dict
 
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import sys
+from modules.utilities import Utilities, YamlDumper
+
+# Compact in-memory form of converted PAN-OS objects. All records of one
+# object type share a single RecordSchema (the key table, built from the
+# 'params' list in panos-api-parameters.yml), and each record only holds a
+# tuple of values, instead of a full dict per object.
+
+_schemas = {}
+
+def get_schema(params):
+  keys = tuple(params)
+  schema = _schemas.get(keys, None)
+  if schema is None:
+    schema = _schemas[keys] = RecordSchema(keys)
+  return schema
+
+def intern_value(value):
+  # config values repeat a lot (zones, 'any', tags, profiles), so share them
+  if isinstance(value, str):
+    return sys.intern(value)
+  if isinstance(value, list):
+    return [ sys.intern(v) if isinstance(v, str) else v for v in value ]
+  return value
+
+def represent_record(dumper, record):
+  # records are written as mappings directly, without building dicts first
+  items = [ (key, value) for key, value in zip(record.schema.keys,
+                                               record.values)
+            if value is not None or not dumper.skip_null ]
+  if record.children is not None:
+    items.append(('children', record.children))
+  return dumper.represent_mapping('tag:yaml.org,2002:map', items)
+
+def records_to_file(file, records, skip_null=True, force_overwrite=False):
+  # runs in a worker process when getyaml --workers is used; records (and
+  # their shared schema) pickle compactly, unlike pan-os-python objects
+  utils = Utilities()
+  utils.yaml_to_file(file, records, force_overwrite, skip_null=skip_null)
+
+class RecordSchema:
+  __slots__ = ('keys', 'index')
+
+  def __init__(self, keys):
+    self.keys = keys
+    self.index = { key: i for i, key in enumerate(keys) }
+
+  def new_record(self, values, children=None):
+    return Record(self, tuple(intern_value(v) for v in values), children)
+
+class Record:
+  __slots__ = ('schema', 'values', 'children')
+
+  def __init__(self, schema, values, children=None):
+    self.schema = schema
+    self.values = values
+    self.children = children
+
+  def __getitem__(self, key):
+    return self.values[self.schema.index[key]]
+
+YamlDumper.add_representer(Record, represent_record)
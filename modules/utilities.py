@@ -1,31 +1,80 @@
 #!/usr/bin/env python3
 
+import atexit
 import base64
 import importlib
 import json
-import keyring
 import logging, logging.handlers
 import os
+import queue
 import re
-import requests
 import sys
 import time
 import yaml
 from collections import OrderedDict
 from copy import deepcopy
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from datetime import datetime
 from getpass import getpass
 
 class YamlDumper(yaml.SafeDumper):
+  # read by the representer for compact records (see modules/records.py)
+  skip_null = True
+
   # insert blank lines between top-level objects
   def write_line_break(self, data=None):
     super().write_line_break(data)
     if len(self.indents) == 1:
       super().write_line_break()
 
+class YamlDumperKeepNull(YamlDumper):
+  skip_null = False
+
+class JsonFormatter(logging.Formatter):
+  # one json object per line; host/vsys/module are added when given as
+  # extra={'host': ..., 'vsys': ..., 'config_module': ...}
+  _extra_fields = {
+    'host': 'host',
+    'vsys': 'vsys',
+    'config_module': 'module',
+    'object_type': 'object_type'
+  }
+
+  def format(self, record):
+    log_record = {
+      'time': datetime.fromtimestamp(record.created).astimezone().isoformat(),
+      'process': record.process,
+      'thread': record.threadName,
+      'level': record.levelname,
+      'line': record.lineno,
+      'message': record.getMessage()
+    }
+    for attribute, field in self._extra_fields.items():
+      value = getattr(record, attribute, None)
+      if value is not None:
+        log_record[field] = value
+    if record.exc_info:
+      log_record['exception'] = self.formatException(record.exc_info)
+    return json.dumps(log_record, ensure_ascii=False, default=str)
+
+class ListenerQueueHandler(logging.handlers.QueueHandler):
+  # the stdlib prepare() formats the record on the calling thread, and
+  # moves the traceback into msg; leave both to the listener's handlers
+  def prepare(self, record):
+    return record
+
+class DeferredFormatter(logging.Formatter):
+  # picks the real formatter when the first record is formatted, so creating
+  # the logger doesn't load the config file
+  def __init__(self, create_formatter):
+    super().__init__()
+    self._create_formatter = create_formatter
+    self._formatter = None
+
+  def format(self, record):
+    if self._formatter is None:
+      self._formatter = self._create_formatter()
+    return self._formatter.format(record)
+
 class Utilities:
   _config_file = 'panos-conf.yml'
   _log_file = 'panos-conf.log'
@@ -40,21 +89,49 @@ class Utilities:
         setattr(self, key, value)
 
   def init(self):
+    # config files are loaded on first access (see the properties below),
+    # so subcommands that never touch them don't pay for parsing
     self.start = self.datetime_now()
-    self.config = self.yaml_from_file(
-        self.get_filepath_config(self._config_file)
-    )
-    self.api_params = self.yaml_from_file(
-        self.get_filepath_config(self._api_params_file)
-    )
     self.log = self.create_logger()
 
-    # disable insecure warnings if ssl_verify=false
-    ssl_verify = self.config.get('settings', True).get('ssl_verify', True)
-    if not ssl_verify:
-      requests.packages.urllib3.disable_warnings(
-        requests.packages.urllib3.exceptions.InsecureRequestWarning
+  @property
+  def config(self):
+    if getattr(self, '_config', None) is None:
+      self._config = self.yaml_from_file(
+          self.get_filepath_config(self._config_file)
       )
+    return self._config
+
+  @config.setter
+  def config(self, value):
+    self._config = value
+
+  @property
+  def api_params(self):
+    if getattr(self, '_api_params', None) is None:
+      self._api_params = self.yaml_from_file(
+          self.get_filepath_config(self._api_params_file)
+      )
+    return self._api_params
+
+  @api_params.setter
+  def api_params(self, value):
+    self._api_params = value
+
+  def get_requests(self):
+    # requests is imported on first use only
+    import requests
+
+    if not getattr(self, '_requests_configured', False):
+      # disable insecure warnings if ssl_verify=false
+      ssl_verify = self.config.get('settings', True).get('ssl_verify', True)
+      if not ssl_verify:
+        requests.packages.urllib3.disable_warnings(
+          requests.packages.urllib3.exceptions.InsecureRequestWarning
+        )
+      self._requests_configured = True
+
+    return requests
 
   def get_work_dir(self):
     return self.work_dir
@@ -91,10 +168,12 @@ class Utilities:
     with open(file, 'r') as f:
       return yaml.safe_load(f)
 
-  def yaml_to_file(self, file, data, force_overwrite=False, yaml_flow=False):
+  def yaml_to_file(self, file, data, force_overwrite=False, yaml_flow=False,
+                   skip_null=True):
+    dumper = YamlDumper if skip_null else YamlDumperKeepNull
     if not os.path.isfile(file) or force_overwrite:
       with open(file, 'w') as f:
-        return yaml.dump(data, f, Dumper=YamlDumper, sort_keys=False,
+        return yaml.dump(data, f, Dumper=dumper, sort_keys=False,
                          default_flow_style=yaml_flow, explicit_start=True,
                          width=32768, encoding="utf8")
 
@@ -149,16 +228,34 @@ class Utilities:
   def create_logger(self):
     logger = logging.getLogger('panos-conf')
     logger.setLevel(logging.DEBUG)
-    formatter = self.create_logger_formatter()
+    formatter = DeferredFormatter(self.create_logger_formatter)
     file_handler = self.create_logger_file_handler(formatter)
     stdout_handler = self.create_logger_stdout_handler(formatter)
 
-    logger.addHandler(file_handler)
-    logger.addHandler(stdout_handler)
+    # records are put on a queue, and formatted/written by the listener
+    # thread, so callers never block on handler i/o or locks
+    log_queue = queue.SimpleQueue()
+    self.log_listener = logging.handlers.QueueListener(
+      log_queue, file_handler, stdout_handler, respect_handler_level=True)
+    self.log_listener.start()
+    atexit.register(self.stop_logger)
+
+    logger.addHandler(ListenerQueueHandler(log_queue))
 
     return logger
 
+  def stop_logger(self):
+    # flush remaining records; safe to call more than once
+    listener = getattr(self, 'log_listener', None)
+    if listener is not None:
+      self.log_listener = None
+      listener.stop()
+
   def create_logger_formatter(self):
+    log_format_type = self.config.get('settings', {}).get('log_format', 'text')
+    if log_format_type == 'json':
+      return JsonFormatter()
+
     log_format = '%(asctime)s | '
     log_format += '%(process)5d | '
     log_format += '%(levelname)-8.8s | '
@@ -263,11 +360,15 @@ class Utilities:
     config_file = self.get_filepath_config(self._config_file)
     self.yaml_to_file(config_file, self.config, force_overwrite=True)
 
-  def write_host_config_file(self, data, file_params, yaml_flow=False):
+  def get_host_config_filepath(self, file_params):
     conf_dir = self.create_host_folder(file_params['conf_dir'])
-    conf_file = conf_dir + '/' + file_params['filename'] + '.yml'
+    return conf_dir + '/' + file_params['filename'] + '.yml'
+
+  def write_host_config_file(self, data, file_params, yaml_flow=False,
+                             skip_null=True):
+    conf_file = self.get_host_config_filepath(file_params)
     self.yaml_to_file(conf_file, data,
-                      file_params['force_overwrite'], yaml_flow)
+                      file_params['force_overwrite'], yaml_flow, skip_null)
 
   def return_sorted_list(self, unsorted_list, sort_param):
     if sort_param is None:
@@ -325,6 +426,10 @@ class Utilities:
       return crypto
 
   def create_crypto(self, password=None):
+    from cryptography.fernet import Fernet
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
     if password is None:
       password = self.get_crypto_password()
     salt = self.set_or_get_salt()
@@ -349,6 +454,8 @@ class Utilities:
       return self.get_password(description="encryption password")
 
   def get_keyring_password(self):
+    import keyring
+
     try:
       password = keyring.get_password(
         self.config['settings']['keyring']['service'],
@@ -360,6 +467,8 @@ class Utilities:
       return password
 
   def set_keyring_password(self, password=None):
+    import keyring
+
     if password is None:
       password = self.get_password(verify=True)
     keyring.set_password(
@@ -411,6 +520,7 @@ class Utilities:
     return crypto.decrypt(data).decode()
 
   def url_post(self, url, data):
+    requests = self.get_requests()
     ssl_verify = self.config.get('settings', True).get('ssl_verify', True)
     try:
       response = requests.post(url, data=data, verify=ssl_verify)
@@ -3,14 +3,8 @@
 import argparse
 import os
 import sys
-from modules.panos_utils import PanosUtils
-from modules.utilities import Utilities
 
 work_dir = os.path.dirname(os.path.realpath(__file__))
-utils = Utilities(work_dir=work_dir)
-utils.init()
-
-panos_utils = PanosUtils(utils=utils)
 
 def parse_arguments():
   parser = argparse.ArgumentParser(description='PAN-OS configuration utility')  
@@ -39,10 +33,27 @@ def parse_arguments():
   # generate yaml config based on current config
   get_yaml = subparsers.add_parser('getyaml', help='get yaml config')
   get_yaml.set_defaults(func=get_yaml_cmd)
-  get_yaml.add_argument('--all', action='store_true', required=True,
+  get_yaml.add_argument('--all', action='store_true',
       help="get all yaml config")
+  get_yaml.add_argument('--host', action='append', metavar='GLOB',
+      help="only hosts matching hostname glob (repeatable)")
+  get_yaml.add_argument('--host-regex', action='append', metavar='REGEX',
+      help="only hosts matching hostname regex (repeatable)")
+  get_yaml.add_argument('--group', action='append',
+      help="only hosts in inventory group (repeatable)")
+  get_yaml.add_argument('--vsys', action='append', metavar='GLOB',
+      help="only vsys matching glob (repeatable)")
+  get_yaml.add_argument('--module', action='append', metavar='GLOB',
+      help="only modules matching glob, e.g. policies (repeatable)")
+  get_yaml.add_argument('--object-type', action='append', metavar='GLOB',
+      help="only object types matching glob, e.g. security_rule or "
+           "policies_security_rule (repeatable)")
   get_yaml.add_argument('--force', action='store_true',
       help="force overwrite exisiting yaml config")
+  get_yaml.add_argument('--workers', type=int, default=0,
+      help="convert and write large object types in this many processes")
+  get_yaml.add_argument('--pool-threshold', type=int, default=1000,
+      help="min objects of a type before using --workers (default: 1000)")
 
   # print help + exit if no arguments given
   if len(sys.argv) == 1:
@@ -50,14 +61,34 @@ def parse_arguments():
     sys.exit(1)
 
   args = parser.parse_args()
+  if getattr(args, 'func', None) is get_yaml_cmd:
+    if not (args.all or any(get_yaml_selectors(args).values())):
+      get_yaml.error("one of --all, --host, --host-regex, --group, --vsys, "
+                     "--module or --object-type is required")
+
   if hasattr(args, 'func'):
-    args.func(args)
+    args.func(args, get_utils())
+
+def get_utils():
+  # imported here, so argparse (and --help) runs before any heavy imports
+  from modules.utilities import Utilities
+
+  utils = Utilities(work_dir=work_dir)
+  utils.init()
+  return utils
 
-def api_key_cmd(args):
+def get_panos_utils(utils):
+  # pan-os-python is only needed by subcommands that talk to devices
+  from modules.panos_utils import PanosUtils
+
+  return PanosUtils(utils=utils)
+
+def api_key_cmd(args, utils):
   if args.set:
+    panos_utils = get_panos_utils(utils)
     panos_utils.set_api_keys(force=args.force, verify=args.verify)
 
-def password_cmd(args):
+def password_cmd(args, utils):
   if args.set:
     password = utils.get_keyring_password()
     if password is None:
@@ -67,9 +98,22 @@ def password_cmd(args):
   if args.change:
     utils.change_password()
 
-def get_yaml_cmd(args):
-  if args.all:
-    panos_utils.get_yaml_conf(args.force)
+def get_yaml_selectors(args):
+  return {
+    "hosts": args.host,
+    "host_regex": args.host_regex,
+    "groups": args.group,
+    "vsys": args.vsys,
+    "modules": args.module,
+    "object_types": args.object_type
+  }
+
+def get_yaml_cmd(args, utils):
+  panos_utils = get_panos_utils(utils)
+  if not panos_utils.get_yaml_conf(args.force, workers=args.workers,
+                                   pool_threshold=args.pool_threshold,
+                                   selectors=get_yaml_selectors(args)):
+    sys.exit(1)
 
 if __name__ == '__main__':
   parse_arguments()